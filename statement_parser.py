@@ -0,0 +1,284 @@
+"""
+Islami Bank Bangladesh PLC statement parser, kept free of web framework code.
+
+The module is fully annotated so it can be compiled ahead of time with mypyc
+(``mypyc statement_parser.py``); the compiled extension is picked up in place of
+this file automatically, and the pure Python version works unchanged without it.
+"""
+import logging
+import logging.handlers
+import re
+from calendar import monthrange
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pypdfium2 as pdfium # type: ignore[import-untyped]
+try:
+    import re2 # type: ignore[import-untyped] # RE2 matches in linear time, so no page text can make a pattern backtrack
+except ImportError:
+    re2 = None
+
+logger = logging.getLogger(__name__)
+
+# --- Pre-compiled patterns ---
+# Compiled once at import time so each request only pays for the match itself.
+# Patterns that scan page text taken from the (untrusted) PDF are compiled with RE2 when it is
+# installed; the google-re2 wrapper costs more per call than re, so patterns that only ever see a
+# short, already-matched field stay on re. Flags are written inline ((?s), (?m)) since
+# re2.compile() takes RE2 options, not re flags.
+# Page text is matched as UTF-8 bytes (see _iter_page_texts), so those patterns are bytes too: the
+# page is encoded once, instead of google-re2 re-encoding the whole str (and mapping every match
+# offset back to str indices) on each call. Only the captured fields get decoded.
+_text_re: Any = re2 or re
+_ACCOUNT_HOLDER_RE = _text_re.compile(rb"Name\s+(.*?)\n") # Simpler match assuming name is first after "Name"
+_ADDRESS_RE = _text_re.compile(rb"(?s)Address\s+(.*?)\nAccount No") # Look for Address before Account No
+_ACCOUNT_NO_RE = _text_re.compile(rb"Account No\s+(\d+)")
+_ACCOUNT_TYPE_RE = _text_re.compile(rb"Account Type\s+(.*?)\n")
+_DATE_RE = re.compile(r"(\d{2})/(\d{2})/(\d{4}|\d{2})") # DD/MM/YYYY or DD/MM/YY, matched whole
+_PERIOD_RE = _text_re.compile(rb"Account Statement for the period of\s+(\d{2}/\d{2}/\d{4})\s+to\s+(\d{2}/\d{2}/\d{4})")
+
+# Transaction lines look like: Trans Date, Post Date, Description..., Withdraw, Deposit, Balance.
+# One line-anchored pattern, run with finditer over the whole page so the engine skips
+# non-transaction lines itself:
+# - Trans Date, Post Date: DD/MM/YY (Groups 1, 2)
+# - Description: optional, non-greedy, whitespace-separated from the amounts (Group 3). Its length is
+#   checked after decoding (_MAX_DESCRIPTION_CHARS); the pattern only bounds it loosely, see below.
+#   It has to start and end on a non-blank, so a run of blanks is never split between the description
+#   and the [ \t]+ runs around it. Otherwise, with no amounts after a long run of blanks, re retries
+#   the [ \t]+ over the rest of the run for every description length, and the line takes quadratic
+#   (cubic right after the Post Date) time to reject
+# - Amounts: one to three whitespace-separated amounts ending the line (Group 4), split afterwards
+#   with _AMOUNT_RE and assigned from the right: Balance, then Deposit, then Withdrawal (a lone amount
+#   before the Balance goes to whichever of the two the balance change points to)
+# A single amount alternative (no separate "0.00" branch) keeps the pattern small. Without RE2 the
+# amount block is matched atomically with the (?=(...))\4 trick (re has no (?>...) before 3.11): a
+# lookahead never gives back what it matched, so when the line doesn't end after the amounts the
+# engine moves on to a longer description instead of retrying every shorter split of the amount block.
+# That only covers the amounts; runs of blanks before them are kept linear by the non-blank
+# description ends above.
+# RE2 never backtracks to begin with, and supports neither lookarounds nor backreferences.
+_AMOUNT = rb"\d{1,3}(?:,\d{3})*\.\d{2}" # Optional thousands separators, two decimals (e.g. 1,234.56 or 0.00)
+_AMOUNT_BLOCK = _AMOUNT + rb"(?:[ \t]+" + _AMOUNT + rb"){0,2}"
+_AMOUNT_RE = re.compile(_AMOUNT)
+# The description repeat only bounds how far re can backtrack on one line, so it is kept well above
+# _MAX_DESCRIPTION_CHARS. It is not a character limit: in a bytes pattern re counts "." in bytes
+# while RE2 (UTF-8 by default) counts characters, so lines with a description past 800 bytes (re)
+# or 800 characters (RE2) are not taken for transaction lines at all.
+_DESCRIPTION_REPEAT = rb"{0,798}"
+_MAX_DESCRIPTION_CHARS = 200 # Longer descriptions are dropped with a warning, whichever engine matched
+_TRANSACTION_RE = _text_re.compile(
+    rb"(?m)^[ \t]*(\d{2}/\d{2}/\d{2})[ \t]+(\d{2}/\d{2}/\d{2})[ \t]+"
+    rb"(?:([^ \t\n](?:." + _DESCRIPTION_REPEAT + rb"?[^ \t\n])?)[ \t]+)??"
+    + (rb"(" + _AMOUNT_BLOCK + rb")" if re2 else rb"(?=(" + _AMOUNT_BLOCK + rb"))\4")
+    + rb"[ \t]*$"
+)
+
+# Irrelevant rows (e.g. the B/F balance line) to skip, checked in a single scan per matched line
+_SKIP_RE = re.compile(rb"Trans Date|Post Date|Report taken on|B/F|Page")
+
+# Transactions are kept as plain tuples while parsing; these name the tuple fields for the JSON output
+Transaction = Tuple[str, str, str, Optional[str], float, float, float]
+TRANSACTION_FIELDS = ("date", "post_date", "description", "reference", "withdrawal", "deposit", "balance")
+
+# Look for the line starting with optional commas/whitespace then "TOTAL"
+# Capture the three numeric values after TOTAL
+_TOTAL_RE = _text_re.compile(rb"(?m)^[\s,]*TOTAL\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})")
+
+
+def _parse_amount(amount: Optional[bytes]) -> float:
+    """
+    Convert an amount column like b"1,234.56" to a float; a missing column counts as 0.00.
+    """
+    if not amount or amount == b"0.00": # Most rows leave one of the two amount columns at zero
+        return 0.00
+    return float(amount.replace(b',', b''))
+
+
+@lru_cache(maxsize=4096) # Statements repeat the same handful of dates many times over
+def convert_date_format(date_str: str) -> str:
+    """
+    Convert date from various potential formats (DD/MM/YY, DD/MM/YYYY) to YYYY-MM-DD.
+    Handles potential errors gracefully.
+    """
+    # Dispatch on the shape with one anchored match, so malformed input is turned away up front
+    # instead of by int()/date() raising: only all-digit DD/MM/YY or DD/MM/YYYY gets through
+    date_match = _DATE_RE.fullmatch(date_str)
+    if not date_match:
+        # Log or handle the error if the format is unexpected
+        # print(f"Warning: Could not parse date '{date_str}'. Returning original.")
+        return date_str # Return original string if all parsing fails
+
+    day_str, month_str, year_str = date_match.groups()
+    day, month, year = int(day_str), int(month_str), int(year_str)
+    if len(year_str) == 2:
+        # DD/MM/YY format (e.g., 01/03/25), same century pivot as strptime's %y (69-99 -> 19xx)
+        year += 1900 if year >= 69 else 2000
+    # Still reject impossible days/months like strptime did
+    if not (year and 1 <= month <= 12 and 1 <= day <= monthrange(year, month)[1]):
+        return date_str
+    return f"{year:04d}-{month_str}-{day_str}"
+
+
+def init_worker_logging(log_queue: Any) -> None:
+    """
+    Process pool initializer: send this worker's parser log records to log_queue, which the
+    server process drains into its own log handlers.
+    """
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+# --- Page text extraction ---
+# PDFium (via pypdfium2) extracts plain text directly, without pdfplumber/pdfminer building a
+# Python object for every character on the page first.
+def _iter_page_texts(pdf_data: bytes) -> Iterator[bytes]:
+    """
+    Yield the text of each PDF page in turn, UTF-8 encoded, so only one page of text is held at a time.
+    """
+    # Errors opening or reading the PDF propagate to the caller, which logs them once
+    with pdfium.PdfDocument(pdf_data) as pdf:
+        for page in pdf:
+            text_page = page.get_textpage()
+            # PDFium ends lines with \r\n; the patterns expect \n
+            yield text_page.get_text_range().replace("\r\n", "\n").encode()
+            text_page.close()
+            page.close()
+
+
+def _extract_account_info(text: bytes, account_info: Dict[str, Any]) -> None:
+    """
+    Fill account_info from the statement header (first page text, up to the transaction table).
+    """
+    try:
+        # Use non-greedy matching and DOTALL for multi-line fields
+        account_holder_match = _ACCOUNT_HOLDER_RE.search(text)
+        address_match = _ADDRESS_RE.search(text)
+        account_no_match = _ACCOUNT_NO_RE.search(text)
+        account_type_match = _ACCOUNT_TYPE_RE.search(text)
+        period_match = _PERIOD_RE.search(text)
+
+        account_info["account_holder"] = account_holder_match.group(1).decode().strip() if account_holder_match else None
+        # If address extraction needs refinement based on structure:
+        # account_info["address"] = address_match.group(1).replace('\n', ' ').strip() if address_match else None # Example handling
+        account_info["account_number"] = account_no_match.group(1).decode() if account_no_match else None
+        account_info["account_type"] = account_type_match.group(1).decode().strip() if account_type_match else None
+
+        if period_match:
+            start_date_str = period_match.group(1).decode()
+            end_date_str = period_match.group(2).decode()
+            # Use the updated convert_date_format
+            account_info["statement_period"] = {
+                "start_date": convert_date_format(start_date_str),
+                "end_date": convert_date_format(end_date_str)
+            }
+        else:
+             account_info["statement_period"] = {"start_date": None, "end_date": None}
+
+    except Exception as e:
+        logger.warning("Error parsing account info: %s", e)
+        # Continue parsing transactions even if account info fails partially
+
+
+def _extract_transactions(text: bytes, transactions: List[Transaction]) -> None:
+    """
+    Append the transactions found on one page of text to transactions, as TRANSACTION_FIELDS tuples.
+    """
+    # Balance after the previous row, carried over from the previous page; rows with just two amounts
+    # need it to tell a withdrawal from a deposit
+    running_balance: Optional[float] = transactions[-1][6] if transactions else None
+
+    # Lines not starting with two dates (headers, footers, blank lines) are never yielded
+    for match in _TRANSACTION_RE.finditer(text):
+        trans_date, post_date, description, amount_block = match.groups()
+        description = description or b""
+        if _SKIP_RE.search(description):
+            if b"B/F" in description: # The balance brought forward is the one the first row starts from
+                running_balance = _parse_amount(_AMOUNT_RE.findall(amount_block)[-1])
+            continue
+
+        try:
+            # Map the amounts by position, right to left: Balance, Deposit, Withdrawal
+            amounts = _AMOUNT_RE.findall(amount_block)
+            balance_before, running_balance = running_balance, _parse_amount(amounts[-1])
+            description_text = description.decode().strip()
+            if len(description_text) > _MAX_DESCRIPTION_CHARS:
+                raise ValueError(f"description longer than {_MAX_DESCRIPTION_CHARS} characters")
+            withdraw: Optional[bytes] = None
+            deposit: Optional[bytes] = None
+            if len(amounts) == 3:
+                withdraw, deposit = amounts[0], amounts[1]
+            elif len(amounts) == 2:
+                # Only one of Withdrawal/Deposit is filled in: the balance going down means a withdrawal
+                if balance_before is None:
+                    raise ValueError("no earlier balance to tell a withdrawal from a deposit")
+                if running_balance < balance_before:
+                    withdraw = amounts[0]
+                else:
+                    deposit = amounts[0]
+
+            # Same order as TRANSACTION_FIELDS
+            transactions.append((
+                convert_date_format(trans_date.decode()),
+                convert_date_format(post_date.decode()),
+                description_text,
+                None, # Instrument No can't be told apart from the description text
+                _parse_amount(withdraw),
+                _parse_amount(deposit),
+                running_balance
+            ))
+        except Exception as e:
+            logger.warning("Error processing transaction line: '%s' - %s", match.group(0).decode(errors="replace").strip(), e)
+            # Optionally skip the problematic line or add partial data
+
+
+def _extract_totals(text: bytes, totals: Dict[str, Optional[float]]) -> None:
+    """
+    Fill totals from the TOTAL line (last page text).
+    """
+    # Search the whole page: footer lines after the TOTAL line (e.g. "TOTAL PAGES 3") can mention TOTAL too
+    total_match = _TOTAL_RE.search(text)
+    if total_match:
+        try:
+            totals["total_withdrawal"] = _parse_amount(total_match.group(1))
+            totals["total_deposit"] = _parse_amount(total_match.group(2))
+            totals["final_balance"] = _parse_amount(total_match.group(3)) # Capture the last balance figure as 'final_balance'
+
+        except Exception as e:
+            logger.warning("Error parsing totals line: %s", e)
+
+
+def parse_bank_statement(pdf_data: bytes) -> Dict[str, Any]:
+    """
+    Parse Islami Bank Bangladesh PLC statement from PDF bytes dynamically.
+    Pages are processed one at a time rather than joined into one big string.
+    """
+    # Every field is present even if the header is never read (e.g. a PDF with no pages)
+    account_info: Dict[str, Any] = {
+        "bank": "Islami Bank Bangladesh PLC.", # Default bank name
+        "account_holder": None,
+        "account_number": None,
+        "account_type": None,
+        "statement_period": {"start_date": None, "end_date": None}
+    }
+    transactions: List[Transaction] = []
+    totals: Dict[str, Optional[float]] = {"total_withdrawal": None, "total_deposit": None, "final_balance": None}
+
+    page_text = b""
+    for page_number, page_text in enumerate(_iter_page_texts(pdf_data)):
+        # --- Account Information Extraction ---
+        if page_number == 0:
+            # The header fields all come before the transaction table, so only search that part
+            header_end = page_text.find(b"Trans Date")
+            _extract_account_info(page_text[:header_end] if header_end >= 0 else page_text, account_info)
+
+        # --- Transaction Extraction ---
+        _extract_transactions(page_text, transactions)
+
+    # --- Total Extraction ---
+    # The TOTAL line closes the statement, so only the last page needs searching
+    _extract_totals(page_text, totals)
+
+    return {
+        "account_info": account_info,
+        "transactions": transactions,
+        "totals": totals # Return the extracted totals
+    }
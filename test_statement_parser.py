@@ -0,0 +1,119 @@
+"""
+Regression tests for the transaction line pattern in statement_parser, run against both regex engines.
+
+Run with: pip install pytest && python -m pytest
+"""
+import importlib.util
+import os
+import sys
+import time
+
+import pytest
+
+_PARSER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "statement_parser.py")
+
+
+def _load_parser(engine):
+    """
+    Load a separate copy of statement_parser.py, with google-re2 hidden for the "re" engine.
+    """
+    saved_re2 = sys.modules.get("re2")
+    if engine == "re":
+        sys.modules["re2"] = None # Makes "import re2" raise ImportError
+    try:
+        spec = importlib.util.spec_from_file_location(f"statement_parser_{engine}", _PARSER_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if engine == "re":
+            if saved_re2 is None:
+                sys.modules.pop("re2", None)
+            else:
+                sys.modules["re2"] = saved_re2
+    return module
+
+
+@pytest.fixture(params=["re", "re2"], scope="module")
+def parser(request):
+    module = _load_parser(request.param)
+    if request.param == "re2" and module.re2 is None:
+        pytest.skip("google-re2 is not installed")
+    return module
+
+
+def test_transaction_row_parses(parser):
+    transactions = []
+    parser._extract_transactions(b"01/03/25 01/03/25 Cash Deposit 0.00 58.73 1,058.73\n", transactions)
+    assert transactions == [("2025-03-01", "2025-03-01", "Cash Deposit", None, 0.0, 58.73, 1058.73)]
+
+
+def test_long_bengali_description_parses(parser):
+    # 100 Bengali characters are 300 bytes of UTF-8, past a 200 byte cap
+    description = "ক" * 100
+    transactions = []
+    parser._extract_transactions(f"01/03/25 01/03/25 {description} 100.00 0.00 5,000.00\n".encode(), transactions)
+    assert transactions == [("2025-03-01", "2025-03-01", description, None, 100.0, 0.0, 5000.0)]
+
+
+def test_two_amount_rows_follow_the_balance(parser):
+    # With a blank Withdrawal or Deposit column, the balance moving down or up tells which one is filled in
+    transactions = []
+    parser._extract_transactions(
+        b"01/03/25 01/03/25 B/F 0.00 0.00 10,000.00\n"
+        b"02/03/25 02/03/25 Cash Deposit 7,000.00 17,000.00\n"
+        b"03/03/25 03/03/25 ATM WDL 5,000.00 12,000.00\n",
+        transactions
+    )
+    assert transactions == [
+        ("2025-03-02", "2025-03-02", "Cash Deposit", None, 0.0, 7000.0, 17000.0),
+        ("2025-03-03", "2025-03-03", "ATM WDL", None, 5000.0, 0.0, 12000.0),
+    ]
+
+
+def test_two_amount_row_without_earlier_balance_is_skipped(parser):
+    transactions = []
+    parser._extract_transactions(
+        b"03/03/25 03/03/25 ATM WDL 5,000.00 12,000.00\n"
+        b"04/03/25 04/03/25 ATM WDL 2,000.00 10,000.00\n",
+        transactions
+    )
+    # The skipped row's balance still counts for the next one
+    assert transactions == [("2025-03-04", "2025-03-04", "ATM WDL", None, 2000.0, 0.0, 10000.0)]
+
+
+def test_overlong_description_is_dropped_with_a_warning(parser, caplog):
+    transactions = []
+    parser._extract_transactions(b"01/03/25 01/03/25 " + b"x" * 201 + b" 100.00 0.00 5,000.00\n", transactions)
+    assert transactions == []
+    assert "longer than 200 characters" in caplog.text
+
+
+@pytest.mark.parametrize("text", [
+    b"01/01/25 01/01/25" + b" " * 20000 + b"x\n", # Blanks right after the Post Date
+    b"01/01/25 01/01/25 a" + b" " * 20000 + b"x\n", # Blanks after a description
+    (b"01/01/25 01/01/25 a" + b" " * 2000 + b"x\n") * 100,
+], ids=["after_post_date", "after_description", "many_lines"])
+def test_long_blank_run_is_rejected_quickly(parser, text):
+    # Long runs of blanks with no amounts after them used to backtrack for seconds to minutes
+    transactions = []
+    started = time.perf_counter()
+    parser._extract_transactions(text, transactions)
+    assert time.perf_counter() - started < 1.0
+    assert transactions == []
+
+
+def test_totals_found_before_a_later_total_line(parser):
+    totals = {"total_withdrawal": None, "total_deposit": None, "final_balance": None}
+    parser._extract_totals(b"x\nTOTAL 1.00 2.00 3.00\nTOTAL PAGES 3\n", totals)
+    assert totals == {"total_withdrawal": 1.0, "total_deposit": 2.0, "final_balance": 3.0}
+
+
+def test_account_info_fields_present_without_pages(parser, monkeypatch):
+    monkeypatch.setattr(parser, "_iter_page_texts", lambda pdf_data: iter(()))
+    assert parser.parse_bank_statement(b"")["account_info"] == {
+        "bank": "Islami Bank Bangladesh PLC.",
+        "account_holder": None,
+        "account_number": None,
+        "account_type": None,
+        "statement_period": {"start_date": None, "end_date": None}
+    }